@@ -7,14 +7,18 @@ minim.web
 
 """
 import os
+import stat
 import sys
 import threading
 import re
-from json import dumps as json_dumps
+from functools import lru_cache
+from json import JSONEncoder
 
 from utils import make_list
 from structures import ConfigDict
-from httputil import not_found, not_allowed
+from httputil import not_found, not_allowed, send_file, wrap_file
+from local import request, response, bind as bind_local, unbind as unbind_local, \
+    reset as reset_local, release as release_local
 
 # from session import Session
 
@@ -24,108 +28,188 @@ __all__ = [
     'Minim'
 ]
 
+#: A shared compact encoder, so that :meth:`Minim._cast` does not build a new
+#: one for every dict/list returned by a handler.
+_json_encode = JSONEncoder(ensure_ascii=False, separators=(',', ':')).encode
+
+try:
+    # orjson is much faster and returns utf-8 bytes directly
+    from orjson import dumps as _orjson_dumps, OPT_NON_STR_KEYS
+
+    def _json_dumps(obj):
+        return _orjson_dumps(obj, option=OPT_NON_STR_KEYS)
+except ImportError:
+    def _json_dumps(obj):
+        return _json_encode(obj).encode('utf-8')
+
+#: The variable segments of a rule: '<name>', '<int:name>' and '<float:name>',
+#: by type -> (the regex of the segment, the converter of the argument).
+_SEGMENT_TYPES = {
+    '': (r'(\w+)', str),
+    'int': (r'(\d+)', int),
+    'float': (r'(-?\d+\.\d{1,13})', float),
+}
+
+def _remaining_size(f):
+    """
+    Return the number of bytes left to read from a file object backed by a
+    regular file, or None if that cannot be told (pipes, sockets, BytesIO).
+    """
+    try:
+        st = os.fstat(f.fileno())
+        if not stat.S_ISREG(st.st_mode):
+            return None
+        return max(st.st_size - f.tell(), 0)
+    except (AttributeError, OSError, ValueError):
+        return None
+
+
+# any variable segment, used to tell static rules from dynamic ones
+_RE_PAT = re.compile(r'<[^/]+>')
+
 
 class Router:
     def __init__(self):
-        self.static_routes = {
-            'GET': {},
-            'POST': {},
-            'PUT': {},
-            'DELETE': {}
-        }
+        #: (method, rule) -> callback, so a static route is found with a
+        #: single dict lookup whatever the method is.
+        self.static_routes = {}
+        #: rule -> the methods it has a static route for.
+        self._static_methods = {}
         self.dynamic_routes = {
             'GET': {},
             'POST': {},
             'PUT': {},
             'DELETE': {}
         }
+        #: method -> {first path segment: (regex match, [(callback, converters), ...])},
+        #: built lazily from :attr:'dynamic_routes' and dropped whenever a route
+        #: is added.
+        self._dynamic_matchers = {}
+        #: dynamic route key -> the literal first segment of its rule, or None
+        #: if the first segment is a variable.
+        self._prefixes = {}
 
     @staticmethod
     def is_static(rule):
-        pattern = re.compile(r'<[^/]+>')
-        return True if pattern.search(rule) is None else False
+        return _RE_PAT.search(rule) is None
 
     def add(self, rule, method, callback):
         if self.is_static(rule):
-            self.static_routes[method][rule] = callback
+            self.static_routes[(method, rule)] = callback
+            self._static_methods.setdefault(rule, set()).add(method)
         else:
             k = self._build_re(rule)
-            self.dynamic_routes[method][k] = callback
+            self.dynamic_routes.setdefault(method, {})[k] = callback
+            self._prefixes[k] = self._first_segment(rule)
+            self._dynamic_matchers.pop(method, None)
 
     @staticmethod
+    def _first_segment(rule):
+        seg = rule.lstrip('/').split('/', 1)[0]
+        return None if '<' in seg else seg
+
+    @staticmethod
+    @lru_cache(maxsize=1024)
     def _build_re(rule):
-        slash_pat = re.compile(r'/')
-        str_pat = re.compile(r'<\s*([a-zA-Z_]\w+)\s*>')
-        int_pat = re.compile(r'<\s*int:\s*([a-zA-Z_]\w+)\s*>')
-        float_pat = re.compile(r'<\s*float:\s*([a-zA-Z_]\w+)\s*>')
         re_list = ['^/']
-        arg_list = []
+        converters = []
 
         if rule.startswith('/'):
             rule = rule[1:]
 
-        for seg in slash_pat.split(rule):
-            if str_pat.match(seg):
-                arg_name = str_pat.match(seg).group(1)
-                arg_list.append(arg_name)
-                re_list.append(r'(?P<%s>\w+)' % arg_name)
-                re_list.append('/')
-            elif int_pat.match(seg):
-                arg_name = int_pat.match(seg).group(1)
-                arg_list.append(arg_name + '_int_')
-                re_list.append(r'(?P<%s>\d+)' % arg_name)
-                re_list.append('/')
-            elif float_pat.match(seg):
-                arg_name = float_pat.match(seg).group(1)
-                arg_list.append(arg_name + '_float_')
-                re_list.append(r'(?P<%s>-?\d+\.\d{1,13})' % arg_name)
-                re_list.append('/')
-            else:
-                re_list.append(seg)
-                re_list.append('/')
-        re_list.pop(-1)
-        re_list.append('$')
-        args = tuple(arg_list)
-        return ''.join(re_list), args
+        for seg in rule.split('/'):
+            if seg[:1] == '<' and seg[-1:] == '>':
+                kind, colon, name = seg[1:-1].partition(':')
+                if not colon:
+                    kind, name = '', kind
+                kind, name = kind.strip(), name.strip()
+                # argument names are ascii identifiers of two chars at least
+                if kind in _SEGMENT_TYPES and len(name) > 1 and \
+                        name.isascii() and name.isidentifier():
+                    pattern, converter = _SEGMENT_TYPES[kind]
+                    converters.append(converter)
+                    re_list.append(pattern)
+                    re_list.append('/')
+                    continue
+            re_list.append(re.escape(seg))
+            re_list.append('/')
+        re_list[-1] = '$'
+        return ''.join(re_list), tuple(converters)
+
+    @staticmethod
+    def _combine(routes):
+        """
+        Combine the '((pattern, converters), callback)' pairs of 'routes' into one
+        alternation regex '^(?:(?P<r0>...)|(?P<r1>...)|...)$', so a url is checked
+        against all of them with a single 're.match' call, and return the bound
+        'match' method of that regex with the list of '(callback, converters)' pairs
+        indexed by the route number.
+        """
+        parts = []
+        targets = []
+        for index, ((pattern, converters), callback) in enumerate(routes):
+            # strip the anchors, the combined regex is anchored as a whole
+            parts.append('(?P<r%d>%s)' % (index, pattern[1:-1]))
+            targets.append((callback, converters))
+        return re.compile('^(?:%s)$' % '|'.join(parts)).match, targets
+
+    def _get_matcher(self, method, url):
+        """
+        Return the combined matcher for the dynamic routes of 'method' that can
+        match 'url'. Routes are grouped by the literal first segment of their
+        rule, so a url is only tried against the routes sharing its first segment
+        and those starting with a variable, in the order they were added.
+        """
+        buckets = self._dynamic_matchers.get(method)
+        if buckets is None:
+            routes = list(self.dynamic_routes.get(method, {}).items())
+            segments = set(self._prefixes[key] for key, _ in routes)
+            segments.add(None)
+            buckets = {}
+            for seg in segments:
+                selected = [route for route in routes
+                            if self._prefixes[route[0]] in (seg, None)]
+                if selected:
+                    buckets[seg] = self._combine(selected)
+            self._dynamic_matchers[method] = buckets
+        return buckets.get(url[1:].split('/', 1)[0]) or buckets.get(None)
 
     def match(self):
         method = request.method
         url = request.path
-        static_func = self.static_routes[method].get(url)
+        static_func = self.static_routes.get((method, url))
         if static_func is not None:
             return static_func()
 
-        for pattern_arg, dynamic_func in self.dynamic_routes[method].items():
-            s = re.compile(pattern_arg[0]).match(url)
+        matcher = self._get_matcher(method, url)
+        if matcher is not None:
+            s = matcher[0](url)
             if s is not None:
-                params = make_list(s.groups())
-                args = pattern_arg[1]
-                for index, arg in enumerate(args):
-                    if arg.endswith('_int_'):
-                        params[index] = int(params[index])
-                    if arg.endswith('_float_'):
-                        params[index] = float(params[index])
-
-                return dynamic_func(*params)
+                dynamic_func, converters = matcher[1][int(s.lastgroup[1:])]
+                # the groups of a route follow its own 'r<index>' group
+                start = s.lastindex
+                params = s.groups()[start:start + len(converters)]
+                return dynamic_func(*[convert(param) for convert, param
+                                      in zip(converters, params)])
 
         # method not allowed
-        for met, route in self.static_routes.items():
-            if met == method:
-                continue
-            if route.get(url) is not None:
-                raise not_allowed()
+        if url in self._static_methods:
+            raise not_allowed()
 
-        for met, route in self.dynamic_routes.items():
+        for met in self.dynamic_routes:
             if met == method:
                 continue
-            for pair in route.keys():
-                if re.compile(pair[0]).match(url) is not None:
-                    raise not_allowed()
+            matcher = self._get_matcher(met, url)
+            if matcher is not None and matcher[0](url) is not None:
+                raise not_allowed()
         # no match
         raise not_found()
 
 
 class Route:
+
+    __slots__ = ('app', 'rule', 'method', 'callback')
+
     def __init__(self, app, rule, method, callback):
         self.app = app
         self.rule = rule
@@ -133,6 +217,55 @@ class Route:
         self.callback = callback
 
 
+class _ClosingIterator:
+    """
+    Wrap a lazy response body, so that the request and response objects stay
+    bound while the server iterates it, and are only unbound by 'close'.
+    """
+
+    __slots__ = ('_iterable', '_tokens')
+
+    def __init__(self, iterable, tokens):
+        self._iterable = iterable
+        self._tokens = tokens
+
+    def __iter__(self):
+        return iter(self._iterable)
+
+    def close(self):
+        tokens, self._tokens = self._tokens, None
+        try:
+            close = getattr(self._iterable, 'close', None)
+            if close is not None:
+                close()
+        finally:
+            if tokens is not None:
+                unbind_local(tokens)
+
+
+def _release_on_close(wrapper, tokens):
+    """
+    Make the 'close' method of the server's file wrapper release the request
+    and response objects as well, and return False if it can't be replaced.
+    The wrapper itself is returned to the server, which only uses sendfile for
+    an object of its own wrapper type.
+    """
+    close = getattr(wrapper, 'close', None)
+
+    def _close():
+        try:
+            if close is not None:
+                close()
+        finally:
+            release_local(tokens)
+
+    try:
+        wrapper.close = _close
+    except AttributeError:
+        return False
+    return True
+
+
 class Minim:
     def __init__(self, import_name=__name__, template_path=None, static_path=None,
                  template_folder='templates', static_folder='static', auto_json=True, **kw):
@@ -142,6 +275,9 @@ class Minim:
         self.static_path = static_path
         self.template_folder = template_folder
         self.static_folder = static_folder
+        #: urls starting with this prefix are served from the static folder
+        #: with a plain 'startswith' check, before any route is looked up.
+        self._static_prefix = '/%s/' % static_folder.strip('/')
         self._running = False
         self._router = Router()
         self._routes = []
@@ -181,9 +317,27 @@ class Minim:
         return func
 
     def match(self):
+        # the static files take every GET request under their prefix
+        path = request.path
+        if path.startswith(self._static_prefix) and request.method == 'GET':
+            return self.send_static(path[len(self._static_prefix):])
         return self._router.match()
 
+    def send_static(self, filename):
+        """
+        Send a file from the static folder of the application.
+        """
+        if self.static_path is None:
+            self.static_path = os.getcwd()
+        directory = os.path.join(self.static_path, self.static_folder)
+        return send_file(response, directory, filename, request.environ)
+
     def add_route(self, route):
+        # GET requests under the static prefix never reach the router, see match
+        if route.method == 'GET' and \
+                ('/' + route.rule.lstrip('/')).startswith(self._static_prefix):
+            raise ValueError('Route %r is shadowed by the static files under %r.'
+                             % (route.rule, self._static_prefix))
         self._routes.append(route)
         self._router.add(route.rule, route.method, route.callback)
 
@@ -198,10 +352,6 @@ class Minim:
 
     def _handle(self, environ):
         try:
-            request.bind(environ)
-            # should not set that here, but something curious with the thread stuff; just for test
-            response.set_header('content-type', 'text/html; charset=UTF-8')
-            response.status_code = 200
             try:
                 if self._before_request_func is not None:
                     self._before_request_func()
@@ -215,20 +365,38 @@ class Minim:
             raise
 
     def _cast(self, out):
+        # most handlers return a str or bytes, check those by exact type first
+        cls = type(out)
+        if cls is str:
+            out = out.encode('utf-8')
+            response.set_header('Content-Length', str(len(out)))
+            return [out]
+        if cls is bytes:
+            response.set_header('Content-Length', str(len(out)))
+            return [out]
+
         if self.auto_json and isinstance(out, (dict, list)):
-            out = [json_dumps(out).encode('utf-8')]
+            out = _json_dumps(out)
+            response.set_header('Content-Type', 'application/json')
+            response.set_header('Content-Length', str(len(out)))
+            out = [out]
         elif not out:
             out = []
-            response.set_header('Content-Length', '0')
+            # a 204 or 304 response has no body, and a Content-Length of a 304
+            # would have to be the one of the full response
+            if response.status_code not in (204, 304):
+                response.set_header('Content-Length', '0')
         elif isinstance(out, str):
-            # test
-            response.set_header('Content-Length', str(len(out.encode('utf-8'))))
-            out = [out.encode('utf-8')]
+            out = out.encode('utf-8')
+            response.set_header('Content-Length', str(len(out)))
+            out = [out]
         elif isinstance(out, bytes):
             out = [out]
         elif hasattr(out, 'read'):
-            # out = request.environ.get('wsgi.file_wrapper', lambda x: iter(lambda: x.read(8192), ''))(out)
-            pass
+            size = _remaining_size(out)
+            if size is not None:
+                response.set_header('Content-Length', str(size))
+            out = wrap_file(out, request.environ)
         elif not hasattr(out, '__iter__'):
             raise TypeError('Request handler returned [%s] which is not iterable.' % type(out).__name__)
         return out
@@ -237,13 +405,26 @@ class Minim:
         pass
 
     def wsgi(self, environ, start_response):
+        tokens = bind_local(environ)
         try:
             out = self._cast(self._handle(environ))
             start_response(response.status, response.wsgi_headers)
-
+        except BaseException:
+            unbind_local(tokens)
+            raise
+        if type(out) is list:
+            # the body is complete already
+            unbind_local(tokens)
             return out
-        finally:
-            pass
+        file_wrapper = environ.get('wsgi.file_wrapper')
+        if isinstance(file_wrapper, type) and type(out) is file_wrapper and \
+                _release_on_close(out, tokens):
+            # a file does not use the bound request, but it may be an uploaded
+            # one, which is only closed (by the release) once it has been sent.
+            reset_local(tokens)
+            return out
+        # a generator or file may still use the request while it is iterated
+        return _ClosingIterator(out, tokens)
 
     def __call__(self, environ, start_response):
         return self.wsgi(environ, start_response)
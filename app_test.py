@@ -0,0 +1,91 @@
+# coding=utf-8
+import io
+import os
+import shutil
+import tempfile
+import unittest
+from wsgiref.handlers import SimpleHandler
+
+import local
+from app import Minim
+from local import request
+
+
+class _Handler(SimpleHandler):
+    """A wsgiref handler which, like a real server, sends the server's own file
+    wrapper with sendfile instead of iterating it.
+    """
+
+    used_sendfile = False
+
+    def sendfile(self):
+        self.used_sendfile = True
+        for data in self.result:
+            self.write(data)
+        return True
+
+
+def _run(app, path, method='GET'):
+    environ = {
+        'REQUEST_METHOD': method,
+        'PATH_INFO': path,
+        'SERVER_NAME': 'localhost',
+        'SERVER_PORT': '80',
+        'SERVER_PROTOCOL': 'HTTP/1.1',
+    }
+    out = io.BytesIO()
+    handler = _Handler(io.BytesIO(), out, io.StringIO(), environ)
+    handler.run(app)
+    head, _, body = out.getvalue().partition(b'\r\n\r\n')
+    return handler, head, body
+
+
+class FileResponseTest(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        os.mkdir(os.path.join(self.root, 'static'))
+        self.path = os.path.join(self.root, 'static', 'a.txt')
+        with open(self.path, 'wb') as f:
+            f.write(b'hello static\n')
+        self.app = Minim(static_path=self.root)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_static_file_uses_sendfile(self):
+        handler, head, body = _run(self.app, '/static/a.txt')
+        self.assertTrue(handler.used_sendfile)
+        self.assertIn(b'200 OK', head)
+        self.assertEqual(body, b'hello static\n')
+
+    def test_returned_file_uses_sendfile_and_is_released(self):
+        opened = []
+
+        @self.app.route('/file')
+        def send():
+            f = open(self.path, 'rb')
+            opened.append(f)
+            return f
+
+        handler, _, body = _run(self.app, '/file')
+        self.assertTrue(handler.used_sendfile)
+        self.assertEqual(body, b'hello static\n')
+        self.assertTrue(opened[0].closed)
+        # the request was given back to the pool once the file was sent
+        self.assertNotIn('environ', local._pool.free[-1][0].__dict__)
+
+    def test_generator_sees_bound_request(self):
+        @self.app.route('/gen')
+        def gen():
+            def body():
+                yield request.path.encode()
+            return body()
+
+        handler, _, body = _run(self.app, '/gen')
+        self.assertFalse(handler.used_sendfile)
+        self.assertEqual(body, b'/gen')
+
+
+if __name__ == '__main__':
+    unittest.main()
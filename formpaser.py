@@ -10,11 +10,10 @@ This module was inspired greatly by werkzeug.
 
 
 import re
-from tempfile import TemporaryFile
-from io import BytesIO
-from urllib.parse import unquote_plus
-import codecs
-from itertools import chain, repeat, tee
+from tempfile import SpooledTemporaryFile
+from io import BytesIO, SEEK_END
+from urllib.parse import unquote_plus, parse_qsl
+import binascii
 from functools import update_wrapper
 
 from structures import FormsDict, FilesDict, HeadersDict, FileStorage
@@ -49,6 +48,8 @@ class LimitedStream(object):
 
     def __init__(self, stream, limit):
         self._read = stream.read
+        self._readinto = getattr(stream, 'readinto', None)
+        self._readline = getattr(stream, 'readline', None)
         self._pos = 0
         self.limit = limit
 
@@ -85,21 +86,38 @@ class LimitedStream(object):
                            the results.
         """
         to_read = self.limit - self._pos
+        if self._readinto is not None and to_read > 0:
+            # read everything into one buffer instead of new bytes objects
+            buf = memoryview(bytearray(min(chunk_size, to_read)))
+            while to_read > 0:
+                try:
+                    n = self._readinto(buf if to_read >= len(buf) else buf[:to_read])
+                except (IOError, ValueError):
+                    return self.on_disconnect()
+                if not n:
+                    return self.on_disconnect()
+                self._pos += n
+                to_read -= n
+            return
         chunk = chunk_size
         while to_read > 0:
             chunk = min(to_read, chunk)
             self.read(chunk)
             to_read -= chunk
+            # read() only returns full chunks, a long body is read in larger ones
+            if chunk < 1024 * 1024:
+                chunk *= 2
 
     def read(self, size=None):
         """Read `size` bytes or if size is not provided everything is read.
         :param size: the number of bytes read.
         """
-        if self._pos >= self.limit:
+        to_read = self.limit - self._pos
+        if to_read <= 0:
             return self.on_exhausted()
-        if size is None or size == -1:  #: -1 is for consistence with file
-            size = self.limit
-        to_read = min(self.limit - self._pos, size)
+        #: -1 is for consistence with file
+        if size is not None and size != -1 and size < to_read:
+            to_read = size
         try:
             read = self._read(to_read)
         except (IOError, ValueError):
@@ -110,10 +128,41 @@ class LimitedStream(object):
         return read
 
     def readline(self, size=None):
-        return NotImplemented
+        """Read one line from the stream, or at most `size` bytes of it."""
+        to_read = self.limit - self._pos
+        if to_read <= 0:
+            return self.on_exhausted()
+        if size is not None and size != -1 and size < to_read:
+            to_read = size
+        try:
+            line = self._readline(to_read)
+        except (IOError, ValueError):
+            return self.on_disconnect()
+        if to_read and not line:
+            return self.on_disconnect()
+        self._pos += len(line)
+        return line
 
     def readlines(self, size=None):
-        return NotImplemented
+        """Read the lines left in the stream. If `size` is given, no more
+        lines are read once the lines read so far add up to `size` bytes.
+        Like :meth:`readline`, only ``\\n`` ends a line.
+        """
+        if size is None or size <= 0:
+            # everything is read at once and split in one go
+            lines = self.read().split(b'\n')
+            last = lines.pop()
+            result = [line + b'\n' for line in lines]
+            if last:
+                result.append(last)
+            return result
+        result = []
+        total = 0
+        while total < size and self._pos < self.limit:
+            line = self.readline()
+            result.append(line)
+            total += len(line)
+        return result
 
     def tell(self):
         """Returns the position of the stream."""
@@ -132,11 +181,15 @@ def stream_iter(stream, limit, buffer_size):
         yield item
 
 
-def stream_factory(total_content_length):
-    """Creates a stream depending on content_length."""
-    if total_content_length > 1024 * 500:
-        return TemporaryFile('wb+')
-    return BytesIO()
+def stream_factory(total_content_length, max_memory_size=1024 * 500):
+    """Creates a stream for an uploaded file. Small requests are kept in a
+    :class:`BytesIO`; otherwise the file is spooled in memory and only rolled
+    over to a temporary file on disk once it grows past `max_memory_size`,
+    so that the small files of a large request never touch the disk.
+    """
+    if total_content_length <= max_memory_size:
+        return BytesIO()
+    return SpooledTemporaryFile(max_memory_size, 'wb+')
 
 
 def exhaust_stream(f):
@@ -149,11 +202,12 @@ def exhaust_stream(f):
             exhaust = getattr(stream, 'exhaust', None)
             if exhaust is not None:
                 exhaust()
+            elif getattr(stream, 'seekable', None) is not None and stream.seekable():
+                # nothing has to be read to get to the end of a seekable stream
+                stream.seek(0, SEEK_END)
             else:
-                while 1:
-                    chunk = stream.read(1024 * 64)
-                    if not chunk:
-                        break
+                while stream.read(1024 * 1024):
+                    pass
     return update_wrapper(wrapper, f)
 
 
@@ -182,15 +236,20 @@ class FormDataParser(object):
                                :exc:`~exceptions.RequestEntityTooLarge`
                                exception is raised.
     :param silent: If set to False parsing errors will not be caught.
+    :param stream_handlers: a dict of file field names to callbacks, these
+                            fields are streamed to the callbacks instead of
+                            being collected, see :meth:`MultiPartParser.register`.
     """
 
     def __init__(self, charset='utf-8', errors='replace',
-                 max_form_memory_size=None, max_content_length=None, silent=True):
+                 max_form_memory_size=None, max_content_length=None, silent=True,
+                 stream_handlers=None):
         self.charset = charset
         self.errors = errors
         self.max_form_memory_size = max_form_memory_size
         self.max_content_length = max_content_length
         self.silent = silent
+        self.stream_handlers = stream_handlers
 
     def parse(self, stream, mimetype, content_length, options=None):
         """Parses the information from the given stream, mimetype,
@@ -227,6 +286,9 @@ class FormDataParser(object):
     def _parse_multipart(self, stream, mimetype, content_length, options):
         parser = MultiPartParser(self.charset, self.errors,
                                  max_form_memory_size=self.max_form_memory_size)
+        if self.stream_handlers:
+            for name, callback in self.stream_handlers.items():
+                parser.register(name, callback)
 
         boundary = options.get('boundary')
         if boundary is None:
@@ -247,7 +309,14 @@ class FormDataParser(object):
            content_length > self.max_form_memory_size:
             # raise exceptions.RequestEntityTooLarge()
             raise Exception('foo')
-        form = parser.parse(stream)
+        if content_length is not None and content_length >= 0:
+            # the body is limited and small enough to be kept in memory, so
+            # read it at once and leave the splitting to parse_qsl.
+            data = stream.read(content_length).decode(self.charset, self.errors)
+            form = FormsDict(parse_qsl(data, keep_blank_values=True,
+                                       encoding=self.charset, errors=self.errors))
+        else:
+            form = parser.parse(stream)
         return stream, form, FilesDict()
 
     parse_functions = {
@@ -267,16 +336,17 @@ class URLEncodedParser:
         for pair in pair_iter:
             if not pair:
                 continue
-            equal = b'='
-            if equal in pair:
-                key, value = pair.split(equal, 1)
-            else:
-                if not keep_blank_values:
-                    continue
-                key = pair
-                value = b''
-            yield unquote_plus(safe_str(key)), unquote_plus(safe_str(value),
-                                                            charset, errors)
+            key, equal, value = pair.partition(b'=')
+            if not equal and not keep_blank_values:
+                continue
+            key = safe_str(key)
+            value = safe_str(value)
+            # most keys and values are not escaped at all
+            if '%' in key or '+' in key:
+                key = unquote_plus(key)
+            if '%' in value or '+' in value:
+                value = unquote_plus(value, charset, errors)
+            yield key, value
 
     @staticmethod
     def make_chunk_iter(stream, separator, limit=None, buffer_size=1024*10):
@@ -292,34 +362,35 @@ class URLEncodedParser:
                       is otherwise already limited).
         :param buffer_size: The optional buffer size.
         """
-        _iter = stream_iter(stream, limit, buffer_size)
-
-        first_item = next(_iter, '')
-        if not first_item:
-            return
-
-        _iter = chain((first_item,), _iter)
-
         separator = safe_bytes(separator)
-        _split = re.compile(b'(' + re.escape(separator) + b')').split
-        _join = b''.join
 
-        buffer = []
-        while True:
-            new_data = next(_iter, '')
-            if not new_data:
-                break
-            chunks = _split(new_data)
-            new_buf = []
-            for i in chain(buffer, chunks):
-                if i == separator:
-                    yield _join(new_buf)
-                    new_buf = []
-                else:
-                    new_buf.append(i)
-            buffer = new_buf
-        if buffer:
-            yield _join(buffer)
+        # the last piece of a read might continue in the next one, so it is
+        # held back; it is only split again once a separator has come in.
+        rest = bytearray()
+        overlap = len(separator) - 1
+        empty = True
+        for new_data in stream_iter(stream, limit, buffer_size):
+            empty = False
+            # a separator split between two reads starts in the held back bytes
+            start = max(len(rest) - overlap, 0)
+            rest += new_data
+            if rest.find(separator, start) == -1:
+                continue
+            chunks = rest.split(separator)
+            rest = chunks.pop()
+            for chunk in chunks:
+                yield bytes(chunk)
+        if not empty:
+            yield bytes(rest)
+
+    def iter_parse(self, stream, keep_blank_values=True, separator='&', limit=None):
+        """Like :meth:'parse', but return a generator of the ``(key, value)``
+        pairs instead of collecting them, so that the caller can stop as soon
+        as it has the fields it needs.
+        """
+        pair_iter = self.make_chunk_iter(stream, separator, limit)
+        return self._url_decode_impl(pair_iter, self.charset,
+                                     keep_blank_values, self.errors)
 
     def parse(self, stream, keep_blank_values=True, separator='&', limit=None):
         """The behavior of stream and limit follows functions like :func:
@@ -333,10 +404,26 @@ class URLEncodedParser:
         :param limit: the content length of the URL data.  Not necessary if
                       a limited stream is provided.
         """
-        pair_iter = self.make_chunk_iter(stream, separator, limit)
-        return FormsDict(self._url_decode_impl(pair_iter, self.charset,
-                                               keep_blank_values, self.errors))
+        return FormsDict(self.iter_parse(stream, keep_blank_values, separator, limit))
+
+
+#: the empty line ending the headers of a part, or starting the buffer
+_headers_end_re = re.compile(rb'(?:\A|\n)\r?\n')
 
+#: printable ascii characters, the last one must not be a space.
+_multipart_boundary_re = re.compile(rb'[ -~]{0,200}[!-~]')
+
+#: the supported Content-Transfer-Encodings and their (C implemented) decoders,
+#: both of them skip the line breaks of the encoded data.
+_transfer_decoders = {
+    'base64': binascii.a2b_base64,
+    'quoted-printable': binascii.a2b_qp
+}
+
+#: everything but the base64 alphabet, which the decoder would skip anyway; it
+#: is removed first so that the encoded data can be cut into whole quanta.
+_base64_junk = bytes(sorted(set(range(256)) - set(
+    b'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/=')))
 
 _begin_form = 'begin_form'
 _begin_file = 'begin_file'
@@ -359,6 +446,25 @@ class MultiPartParser(object):
         assert buffer_size >= 1024, 'buffer size has to be at least 1KB'
 
         self.buffer_size = buffer_size
+        self._handlers = {}
+
+    def register(self, name, callback):
+        """Stream the file field `name` to `callback` instead of collecting it.
+
+        The callback is called as ``callback(name, filename, headers, body)``
+        as soon as the headers of the part are parsed, `body` being an iterator
+        over the chunks (bytes-like objects) of the part. It is called before
+        the rest of the request is parsed and whatever it does not consume is
+        skipped; the part is not added to the returned files.
+        """
+        self._handlers[name] = callback
+
+    @staticmethod
+    def _iter_part(parts):
+        for tag, cont in parts:
+            if tag == _end:
+                return
+            yield cont
 
     @staticmethod
     def _fix_ie_filename(filename):
@@ -373,72 +479,68 @@ class MultiPartParser(object):
     @staticmethod
     def is_valid_multipart_boundary(boundary):
         """Checks if the string given is a valid multipart boundary."""
-        multipart_boundary_re = re.compile('^[ -~]{0,200}[!-~]$')
-        return multipart_boundary_re.match(boundary) is not None
+        return _multipart_boundary_re.fullmatch(safe_bytes(boundary)) is not None
 
     @staticmethod
-    def parse_multipart_headers(iterable):
-        """Parses multipart headers from an iterable that yields lines (including
-        the trailing newline symbol).  The iterable has to be newline terminated.
-
-        The iterable will stop at the line where the headers ended so it can be
-        further consumed.
+    def parse_multipart_headers(block):
+        """Parses the header block of a part, without the empty line ending it,
+        into a :class:`HeadersDict`. The block is decoded once and split into
+        lines, a line starting with a space or a tab continues the previous header.
 
-        :param iterable: iterable of strings that are newline terminated
+        :param block: the bytes of the header lines
         """
-        def _line_parse(l):
-            """Removes line ending characters and returns a tuple (`stripped_line`,
-            `is_terminated`).
-            """
-            if l[-2:] in ['\r\n']:
-                return l[:-2], True
-            elif l[-1:] in ['\r', '\n']:
-                return l[:-1], True
-            return l, False
-
         result = []
-        for line in iterable:
-            line, line_terminated = _line_parse(safe_str(line))
-            if not line_terminated:
-                raise ValueError('unexpected end of line in multipart header.')
+        for line in safe_str(block).split('\n'):
+            if line[-1:] == '\r':
+                line = line[:-1]
             if not line:
-                break
+                continue
             elif line[0] in ' \t' and result:
                 key, value = result[-1]
                 result[-1] = (key, value + '\n ' + line[1:])
             else:
-                parts = line.split(':', 1)
-                if len(parts) == 2:
-                    result.append((parts[0].strip(), parts[1].strip()))
+                key, colon, value = line.partition(':')
+                if colon:
+                    result.append((key.strip(), value.strip()))
 
         return HeadersDict(result)
 
-    @staticmethod
-    def _find_terminator(iterator):
-        """The terminator might have some additional newlines before it.
-        There is at least one application that sends additional newlines
-        before headers (the python setuptools package).
-        """
-        for line in iterator:
-            if not line:
-                break
-            line = line.strip()
-            if line:
-                return line
-        return b''
-
     @staticmethod
     def fail(message):
         raise ValueError(message)
 
     @staticmethod
     def get_part_encoding(headers):
-        supported_multipart_encodings = frozenset(['base64', 'quoted-printable'])
         transfer_encoding = headers.get('content-transfer-encoding')
-        if transfer_encoding is not None and \
-           transfer_encoding in supported_multipart_encodings:
+        if transfer_encoding in _transfer_decoders:
             return transfer_encoding
 
+    def decode_part(self, encoded, chunk, transfer_encoding, final=False):
+        """Add `chunk` of a transfer encoded part to the `encoded` buffer and
+        return what can be decoded of it so far: whole base64 quanta of four
+        characters, or whole quoted-printable lines. The rest is kept in the
+        buffer, and everything is decoded when `final` is true.
+        """
+        base64 = transfer_encoding == 'base64'
+        if base64:
+            chunk = chunk.translate(None, _base64_junk)
+        encoded += chunk
+        if final:
+            end = len(encoded)
+        elif base64:
+            end = len(encoded) - len(encoded) % 4
+        else:
+            # an escape sequence or a soft line break never spans lines
+            end = encoded.rfind(b'\n') + 1
+        if not end:
+            return b''
+        try:
+            data = _transfer_decoders[transfer_encoding](encoded[:end])
+        except binascii.Error:
+            self.fail('could not decode transfer encoded chunk.')
+        del encoded[:end]
+        return data
+
     def get_part_charset(self, headers):
         # Figure out input charset for current part
         content_type = headers.get('content-type')
@@ -450,7 +552,9 @@ class MultiPartParser(object):
     def start_file_streaming(self, filename, total_content_length):
         if isinstance(filename, bytes):
             filename = filename.decode(self.charset, self.errors)
-        filename = self._fix_ie_filename(filename)
+        # only a windows path has to be fixed, and it contains a backslash
+        if '\\' in filename:
+            filename = self._fix_ie_filename(filename)
         container = stream_factory(total_content_length)
         return filename, container
 
@@ -466,7 +570,8 @@ class MultiPartParser(object):
     def make_line_iter(stream, limit=None, buffer_size=10 * 1024):
         """Safely iterates line-based over an input stream.  If the input stream
         is not a :class:`LimitedStream` the `limit` parameter is mandatory.
-        This uses the stream's :meth:`~file.read` method.
+        This uses the stream's :meth:`~file.read` method.  A line ends with
+        ``\\n`` (or ``\\r\\n``), a single ``\\r`` does not end a line.
 
         :param stream: the stream or iterate to iterate over.
         :param limit: the limit in bytes for the stream.  (Usually
@@ -474,32 +579,23 @@ class MultiPartParser(object):
                       is a :class:`LimitedStream`.
         :param buffer_size: The optional buffer size.
         """
-        _iter = stream_iter(stream, limit, buffer_size)
-
-        first_item = next(_iter, '')
-        if not first_item:
-            return
-
-        empty = b''
-        crlf = b'\r\n'
-
-        _iter = chain((first_item,), _iter)
-
-        _join = empty.join
-        buffer = []
-        while True:
-            new_data = next(_iter, '')
-            if not new_data:
-                break
-            new_buf = []
-            for i in chain(buffer, new_data.splitlines(True)):
-                new_buf.append(i)
-                if i and i[-1:] in crlf:
-                    yield _join(new_buf)
-                    new_buf = []
-            buffer = new_buf
-        if buffer:
-            yield _join(buffer)
+        # the unfinished line, reused for every line
+        buf = bytearray()
+        for new_data in stream_iter(stream, limit, buffer_size):
+            pos = 0
+            end = new_data.find(b'\n') + 1
+            while end:
+                if buf:
+                    buf += new_data[pos:end]
+                    yield bytes(buf)
+                    buf.clear()
+                else:
+                    yield new_data[pos:end]
+                pos = end
+                end = new_data.find(b'\n', pos) + 1
+            buf += new_data[pos:]
+        if buf:
+            yield bytes(buf)
 
     def parse_lines(self, stream, boundary, content_length):
         """Generate parts:
@@ -511,17 +607,45 @@ class MultiPartParser(object):
         Always obeys the grammar:
         parts = ( begin_form cont* end |
                   begin_file cont* end )*
-        """
-        empty_string_iter = repeat('')
 
+        The body of a part is not split into lines: the stream is read in blocks
+        of :attr:'buffer_size' and the next boundary is looked up in the whole
+        block with 'bytes.find', so a part is yielded in chunks of about a block.
+        """
         next_part = b'--' + boundary
         last_part = next_part + b'--'
+        # a part ends at the line break in front of the next boundary
+        delimiter = b'\n' + next_part
+        hold = len(delimiter)
 
-        iterator = chain(self.make_line_iter(stream, limit=content_length,
-                                             buffer_size=self.buffer_size),
-                         empty_string_iter)
+        blocks = stream_iter(stream, content_length, self.buffer_size)
+        buf = bytearray()
 
-        terminator = self._find_terminator(iterator)
+        def read_line():
+            """Return the next line of 'buf' with its line break, or what is
+            left of the stream (b'' in the end) if there is no more line break.
+            """
+            while True:
+                pos = buf.find(b'\n')
+                if pos != -1:
+                    line = bytes(buf[:pos + 1])
+                    del buf[:pos + 1]
+                    return line
+                data = next(blocks, b'')
+                if not data:
+                    line = bytes(buf)
+                    buf.clear()
+                    return line
+                buf.extend(data)
+
+        # there might be some additional newlines before the first boundary,
+        # at least one application sends them (the python setuptools package).
+        terminator = read_line().strip()
+        while not terminator:
+            line = read_line()
+            if not line:
+                break
+            terminator = line.strip()
 
         if terminator == last_part:
             return
@@ -529,7 +653,19 @@ class MultiPartParser(object):
             self.fail('Expected boundary at start of multipart data')
 
         while terminator != last_part:
-            headers = self.parse_multipart_headers(iterator)
+            # the headers end with an empty line, which may come first
+            pos = 0
+            while True:
+                m = _headers_end_re.search(buf, pos)
+                if m is not None:
+                    break
+                data = next(blocks, b'')
+                if not data:
+                    self.fail('unexpected end of line in multipart header.')
+                pos = max(len(buf) - 2, 0)
+                buf.extend(data)
+            headers = self.parse_multipart_headers(bytes(buf[:m.start()]))
+            del buf[:m.end()]
             disposition = headers.get('content-disposition')
             if disposition is None:
                 self.fail('Missing Content-Disposition header')
@@ -548,56 +684,61 @@ class MultiPartParser(object):
             else:
                 yield _begin_file, (headers, name, filename)
 
-            buf = b''
-            for line in iterator:
-                if not line:
-                    self.fail('unexpected end of stream')
+            # a transfer encoded part is decoded as it comes in, see decode_part
+            encoded = bytearray() if transfer_encoding is not None else None
+            start = 0
+            while True:
+                idx = buf.find(delimiter, start)
+                if idx == -1:
+                    # everything but a tail which could be the beginning of the
+                    # delimiter (and the '\r' in front of it) is part content.
+                    flush = len(buf) - hold
+                    if flush > 0:
+                        # a bytearray slice is the only copy made of the content
+                        chunk = buf[:flush]
+                        del buf[:flush]
+                        if encoded is None:
+                            yield _cont, chunk
+                        else:
+                            chunk = self.decode_part(encoded, chunk, transfer_encoding)
+                            if chunk:
+                                yield _cont, chunk
+                    data = next(blocks, b'')
+                    if not data:
+                        self.fail('unexpected end of stream')
+                    buf.extend(data)
+                    start = 0
+                    continue
 
-                if line[:2] == b'--':
-                    terminator = line.rstrip()
-                    if terminator in (next_part, last_part):
+                # the boundary line may only be followed by '--' for the last
+                # part, and by some whitespace (transport padding).
+                after = idx + len(delimiter)
+                end_of_line = buf.find(b'\n', after)
+                while end_of_line == -1 and buf[after:].rstrip() in (b'', b'-', b'--'):
+                    data = next(blocks, b'')
+                    if not data:
+                        end_of_line = len(buf)
                         break
+                    buf.extend(data)
+                    end_of_line = buf.find(b'\n', after)
+                rest = buf[after:end_of_line].rstrip() if end_of_line != -1 else None
+                if rest not in (b'', b'--'):
+                    # not a boundary after all, e.g. '--boundary-and-more'
+                    start = idx + 1
+                    continue
 
-                if transfer_encoding is not None:
-                    if transfer_encoding == 'base64':
-                        transfer_encoding = 'base64_codec'
-                    try:
-                        line = codecs.decode(line, transfer_encoding)
-                    except Exception:
-                        self.fail('could not decode transfer encoded chunk.')
-
-                # we have something in the buffer from the last iteration.
-                # this is usually a newline delimiter.
-                if buf:
-                    yield _cont, buf
-                    # buf = b''
-
-                # If the line ends with windows CRLF we write everything except
-                # the last two bytes.  In all other cases however we write
-                # everything except the last byte.  If it was a newline, that's
-                # fine, otherwise it does not matter because we will write it
-                # the next iteration.  This ensures we do not write the
-                # final newline into the stream.  That way we do not have to
-                # truncate the stream.  However we do have to make sure that
-                # if something else than a newline is in there we write it
-                # out.
-                if line[-2:] == b'\r\n':
-                    buf = b'\r\n'
-                    cutoff = -2
+                end = idx - 1 if idx and buf[idx - 1] == 13 else idx  # 13 is '\r'
+                chunk = buf[:end]
+                del buf[:end_of_line + 1]
+                if encoded is None:
+                    if chunk:
+                        yield _cont, chunk
                 else:
-                    buf = line[-1:]
-                    cutoff = -1
-                yield _cont, line[:cutoff]
-
-            else:
-                raise ValueError('unexpected end of part')
-
-            # if we have a leftover in the buffer that is not a newline
-            # character we have to flush it, otherwise we will chop off
-            # certain values.
-            if buf not in (b'', b'\r', b'\n', b'\r\n'):
-                print('wow~~~a leftover ')
-                yield _cont, buf
+                    chunk = self.decode_part(encoded, chunk, transfer_encoding, True)
+                    if chunk:
+                        yield _cont, chunk
+                terminator = last_part if rest == b'--' else next_part
+                break
 
             yield _end, None
 
@@ -606,10 +747,18 @@ class MultiPartParser(object):
         ``('form', (name, val))`` parts.
         """
         in_memory = 0
+        handlers = self._handlers
 
-        for tag, cont in self.parse_lines(stream, boundary, content_length):
+        parts = self.parse_lines(stream, boundary, content_length)
+        for tag, cont in parts:
             if tag == _begin_file:
                 headers, name, filename = cont
+                if name in handlers:
+                    body = self._iter_part(parts)
+                    handlers[name](name, filename, headers, body)
+                    for _ in body:
+                        pass
+                    continue
                 is_file = True
                 guard_memory = False
                 filename, container = self.start_file_streaming(filename, content_length)
@@ -618,8 +767,8 @@ class MultiPartParser(object):
             elif tag == _begin_form:
                 headers, name = cont
                 is_file = False
-                container = []
-                _write = container.append
+                container = bytearray()
+                _write = container.extend
                 guard_memory = self.max_form_memory_size is not None
 
             elif tag == _cont:
@@ -641,15 +790,19 @@ class MultiPartParser(object):
                 else:
                     part_charset = self.get_part_charset(headers)
                     yield ('form',
-                           (name, b''.join(container).decode(
+                           (name, container.decode(
                                part_charset, self.errors)))
 
     def parse(self, stream, boundary, content_length):
-        form_stream, file_stream = tee(
-            self.parse_parts(stream, boundary, content_length), 2)
-        form = (p[1] for p in form_stream if p[0] == 'form')
-        files = (p[1] for p in file_stream if p[0] == 'file')
-        return FormsDict(form), FilesDict(files)
+        self.validate_boundary(boundary)
+        form = FormsDict()
+        files = FilesDict()
+        for kind, (name, value) in self.parse_parts(stream, boundary, content_length):
+            if kind == 'file':
+                files.add(name, value)
+            else:
+                form.add(name, value)
+        return form, files
 
 
 ####
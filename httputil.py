@@ -8,6 +8,11 @@ minim.http_utils
 
 import os
 import re
+import sys
+import stat
+from email.utils import formatdate, parsedate_tz, mktime_tz
+from functools import partial
+from types import MappingProxyType
 from utils import safe_str, safe_bytes
 import mimetypes
 
@@ -75,6 +80,10 @@ RESPONSE_STATUSES = {
     510: 'Not Extended',
 }
 
+#: code -> status line, e.g. 404 -> '404 Not Found', formatted once at import.
+STATUS_LINES = dict((code, sys.intern('%d %s' % (code, msg)))
+                    for code, msg in RESPONSE_STATUSES.items())
+
 # _RE_RESPONSE_STATUS = re.compile(r'^\d\d\d( [\w ]+)?$')
 
 RESPONSE_HEADERS = (
@@ -119,6 +128,10 @@ RESPONSE_HEADERS = (
     'X-UA-Compatible',
 )
 
+#: upper-cased header name -> canonical spelling, e.g. 'ETAG' -> 'ETag'.
+#: Frozen, it is shared by every :class:'HeadersDict'.
+RESPONSE_HEADER_DICT = MappingProxyType({h.upper(): h for h in RESPONSE_HEADERS})
+
 
 HEADER_X_POWERED_BY = ('X-Powered-By', 'minim/0.1')
 
@@ -132,19 +145,21 @@ class HttpError(Exception):
         Init an HttpError with response code.
         """
         super(HttpError, self).__init__()
-        self.status = '%d %s' % (code, RESPONSE_STATUSES[code])
+        self.status = STATUS_LINES[code]
         self.msg = msg
+        # the headers added with :meth:'header', X-Powered-By is not stored here
+        self._headers = None
 
     def header(self, name, value):
-        if not hasattr(self, '_headers'):
-            self._headers = [HEADER_X_POWERED_BY]
+        if self._headers is None:
+            self._headers = []
         self._headers.append((name, value))
 
     @property
     def headers(self):
-        if hasattr(self, '_headers'):
-            return self._headers
-        return []
+        if self._headers:
+            return (HEADER_X_POWERED_BY, *self._headers)
+        return ()
 
     def __str__(self):
         return self.status + ': ' + self.msg if self.msg else self.status
@@ -241,23 +256,187 @@ def redirect(req, res, url, code=None):
     return res
 
 
+#: The size of the blocks a file is sent in.
+FILE_BLOCK_SIZE = 64 * 1024
+
+#: Not available on every platform (Windows, macOS).
+_fadvise = getattr(os, 'posix_fadvise', None)
+
+
+def wrap_file(f, environ=None, block_size=FILE_BLOCK_SIZE):
+    """
+    Turn a file object into a WSGI response iterable. If the WSGI server
+    provides a 'wsgi.file_wrapper' in 'environ' the file is handed over to it,
+    which most servers implement with sendfile(2), so the file content never
+    has to be copied into Python objects. Otherwise the file is read in blocks
+    of 'block_size' by a :class:'FileIterator'.
+    """
+    file_wrapper = environ and environ.get('wsgi.file_wrapper')
+    if file_wrapper is not None:
+        return file_wrapper(f, block_size)
+    return FileIterator(f, block_size)
+
+
+class FileIterator:
+    """
+    The WSGI response iterable of :func:'wrap_file' when the server has no
+    'wsgi.file_wrapper'. The read loop runs in C via iter(callable, sentinel),
+    with read(0) as the sentinel so that it matches the mode of the file
+    (b'' or ''), and the file is closed by the server through the 'close'
+    method, as PEP 3333 requires.
+    """
+
+    __slots__ = ('file', 'block_size')
+
+    def __init__(self, f, block_size=FILE_BLOCK_SIZE):
+        self.file = f
+        self.block_size = block_size
+
+    def __iter__(self):
+        read = self.file.read
+        return iter(partial(read, self.block_size), read(0))
+
+    def close(self):
+        self.file.close()
+
+
+#: file extension -> content type, filled by :func:'_get_mime_type' as files
+#: are sent. Only existing files get here, so it is bounded by the extensions
+#: actually served.
+_MIME_TYPES = {}
+
+
+def _get_mime_type(path):
+    """
+    Return the content type of a file, looking it up by extension in
+    :data:'_MIME_TYPES' and asking :mod:'mimetypes' only the first time an
+    extension is seen.
+    """
+    _, dot, ext = path.rpartition('.')
+    if not dot or '/' in ext or os.sep in ext:
+        return 'application/octet-stream'
+    ext = ext.lower()
+    try:
+        return _MIME_TYPES[ext]
+    except KeyError:
+        # interned, so that extensions of the same type share one string
+        mime_type = sys.intern(mimetypes.guess_type('file.' + ext)[0] or
+                               'application/octet-stream')
+        _MIME_TYPES[ext] = mime_type
+        return mime_type
+
+
 # an incomplete func
-def send_file(res, directory, filename):
-    filepath = os.path.join(directory, filename)
-    if not os.path.isfile(filepath):
+#: The 'max-age' of the Cache-Control header sent with static files, in seconds.
+STATIC_MAX_AGE = 86400
+
+
+def _not_modified(environ, etag, mtime):
+    """
+    Tell whether the conditional headers of 'environ' show that the client
+    already has the file with 'etag', last modified at 'mtime'.
+    If-None-Match takes precedence over If-Modified-Since.
+    """
+    if environ is None:
+        return False
+    if_none_match = environ.get('HTTP_IF_NONE_MATCH')
+    if if_none_match is not None:
+        return if_none_match.strip() == '*' or \
+            etag in [tag.strip() for tag in if_none_match.split(',')]
+    if_modified_since = environ.get('HTTP_IF_MODIFIED_SINCE')
+    if if_modified_since:
+        since = parsedate_tz(if_modified_since.split(';', 1)[0])
+        return since is not None and mktime_tz(since) >= int(mtime)
+    return False
+
+
+def _gzip_sibling(filepath, st):
+    """
+    Return the stat result of the precompressed '<filepath>.gz' if there is
+    one which is not older than the file itself ('st'), else None.
+    """
+    if filepath.endswith('.gz'):
+        return None
+    try:
+        gzip_st = os.stat(filepath + '.gz')
+    except OSError:
+        return None
+    if stat.S_ISREG(gzip_st.st_mode) and gzip_st.st_mtime >= st.st_mtime:
+        return gzip_st
+    return None
+
+
+def _accepts_gzip(accept_encoding):
+    """
+    Tell whether an Accept-Encoding header value allows a gzip response.
+    An explicit 'gzip' entry wins over '*', wherever it is in the list.
+    """
+    if not accept_encoding:
+        return False
+    wildcard = False
+    for coding in accept_encoding.split(','):
+        name, _, params = coding.partition(';')
+        name = name.strip().lower()
+        if name in ('gzip', 'x-gzip', '*'):
+            accepted = params.replace(' ', '') not in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000')
+            if name != '*':
+                return accepted
+            wildcard = accepted
+    return wildcard
+
+
+def send_file(res, directory, filename, environ=None, max_age=STATIC_MAX_AGE):
+    """
+    Send a file from 'directory', see :func:'wrap_file'.
+    The file is sent with ETag, Last-Modified and Cache-Control headers, and
+    a conditional request for an unchanged file gets an empty 304 response.
+    If a gzipped copy ('<filename>.gz', at least as recent) sits next to the
+    file, it is sent instead to the clients which accept gzip.
+    """
+    if not filename:
+        raise not_found()
+    directory = os.path.abspath(directory)
+    filepath = os.path.abspath(os.path.join(directory, filename))
+    if not filepath.startswith(directory + os.sep):
+        raise forbidden()
+    try:
+        st = os.stat(filepath)
+    except OSError:
+        raise not_found()
+    if not stat.S_ISREG(st.st_mode):
         raise not_found()
-    mime_type = mimetypes.guess_type(filepath)[0] or 'application/octet-stream'
-    res.set_header('content-type', mime_type)
 
-    def _static_file_generator(path):
-        block_size = 8192
-        with open(path, 'rb') as f:
-            block = f.read(block_size)
-            while block:
-                yield block
-                block = f.read(block_size)
+    mime_type = _get_mime_type(filepath)
+    encoding = ''
+    gzip_st = _gzip_sibling(filepath, st)
+    if gzip_st is not None:
+        res.set_header('vary', 'Accept-Encoding')
+        if environ is not None and _accepts_gzip(environ.get('HTTP_ACCEPT_ENCODING')):
+            filepath, st, encoding = filepath + '.gz', gzip_st, 'gzip'
+            res.set_header('content-encoding', encoding)
+
+    # the encoding is part of the tag: both variants must never compare equal
+    etag = 'W/"%x-%x%s"' % (st.st_mtime_ns, st.st_size, encoding and '-' + encoding)
+    res.set_header('etag', etag)
+    res.set_header('last-modified', formatdate(st.st_mtime, usegmt=True))
+    res.set_header('cache-control', 'public, max-age=%d' % max_age)
+    if _not_modified(environ, etag, st.st_mtime):
+        res.status_code = 304
+        # the headers of a 304 update the cached response: do not let the
+        # default content type replace the one of the file
+        res.remove_header('content-type')
+        return ()
 
-    return _static_file_generator(filepath)
+    res.set_header('content-type', mime_type)
+    res.set_header('content-length', str(st.st_size))
+    # Unbuffered: every block is read by one read(2) straight into the bytes
+    # object that is yielded, without going through a BufferedReader first.
+    f = open(filepath, 'rb', buffering=0)
+    if _fadvise is not None:
+        # the file is read once from start to end: ask for a larger readahead
+        _fadvise(f.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+
+    return wrap_file(f, environ)
 
 
 def environ_from_url(path):
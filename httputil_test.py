@@ -0,0 +1,34 @@
+# coding=utf-8
+import io
+import os
+import tempfile
+import unittest
+
+from httputil import FileIterator
+
+
+class FileIteratorTest(unittest.TestCase):
+
+    def test_binary_file(self):
+        fd, path = tempfile.mkstemp()
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(b'hello world')
+            it = FileIterator(open(path, 'rb'), 4)
+            self.assertEqual(list(it), [b'hell', b'o wo', b'rld'])
+            it.close()
+            self.assertTrue(it.file.closed)
+        finally:
+            os.remove(path)
+
+    def test_text_body(self):
+        it = FileIterator(io.StringIO('hello'), 2)
+        self.assertEqual(list(it), ['he', 'll', 'o'])
+
+    def test_empty_body(self):
+        self.assertEqual(list(FileIterator(io.BytesIO(b''))), [])
+        self.assertEqual(list(FileIterator(io.StringIO(''))), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
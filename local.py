@@ -6,92 +6,145 @@ minim.local
 This module implements context-local objects.
 
 """
+from contextvars import ContextVar
+from threading import local
 from request import Request
 from response import Response
-from threading import local
-from threading import get_ident
 
 
-class _Local(local):
-    """An interface for registering request and response objects.
+#: The request and response object for the current context. Outside of an HTTP
+#: conversation (in the main thread, or any thread which is not receiving HTTP
+#: requests) these are the module-level defaults below. Unlike a thread local,
+#: a context variable lookup is a single C call and also works under asyncio.
+_request_var = ContextVar('minim.request', default=Request())
+_response_var = ContextVar('minim.response', default=Response())
+
+_vars = {
+    'request': _request_var,
+    'response': _response_var
+}
+
+
+#: Request and response objects are pooled per thread and rebound to the next
+#: environ instead of being built and thrown away for every request.
+_pool = local()
+
+#: The maximum number of idle request/response pairs kept by each thread.
+POOL_SIZE = 64
+
+
+def _acquire(environ):
+    free = getattr(_pool, 'free', None)
+    if free:
+        req, res = free.pop()
+        req.bind(environ)
+        res.reset()
+        return req, res
+    return Request(environ), Response()
+
+
+def _release(req, res):
+    req.close()
+    # do not keep the environ (and its input stream) alive while idle
+    req.__dict__.clear()
+    try:
+        free = _pool.free
+    except AttributeError:
+        free = _pool.free = []
+    if len(free) < POOL_SIZE:
+        free.append((req, res))
 
-    Rather than have a separate "thread local" object for tht request and the response,
-    this class works as a single thread local container for both objects (and any others
-    which you wish to define). In this way, we can easily dump those objects when we stop
-    /start a new HTTP conversation, yet still refer to them as module-level globals in a
-    thread-safe way.
+
+def bind(environ):
+    """Take a request and response object for 'environ' from the pool of the
+    current thread and make them current. Return the tokens to be passed to
+    :func:'unbind' once the HTTP conversation is over.
     """
-    #: The request and response object for the current thread. In the main thread, and any threads which
-    #: are not receiving HTTP requests, this is None.
-    request = Request()
-    response = Response()
+    req, res = _acquire(environ)
+    return req, res, _request_var.set(req), _response_var.set(res)
 
-    def load(self, req, res):
-        self.request = req
-        self.response = res
 
-    def clear(self):
-        """Remove all attributes of self."""
-        self.__dict__.clear()
+def unbind(tokens):
+    """Restore the request and response objects replaced by :func:'bind' and
+    give those back to the pool, that is :func:'reset' and :func:'release'.
 
-_local = _Local()
+    This closes the request (and its uploaded files), so it must only be called
+    once the response body is done with, that is from its 'close' method. The
+    server may call that from another context, the objects are released anyway.
+    """
+    reset(tokens)
+    release(tokens)
 
 
-class _ThreadLocalProxy:
+def reset(tokens):
+    """Restore the request and response objects replaced by :func:'bind',
+    without releasing the current ones yet.
+    """
+    try:
+        _request_var.reset(tokens[2])
+        _response_var.reset(tokens[3])
+    except ValueError:
+        # the tokens were created in a different context
+        pass
+
+
+def release(tokens):
+    """Close the request and response objects of :func:'bind' and give those
+    back to the pool.
+    """
+    _release(tokens[0], tokens[1])
+
+
+class _ContextLocalProxy:
 
     __slots__ = ['__attrname__', '__dict__']
 
     def __init__(self, attrname):
         self.__attrname__ = attrname
 
+    def _get_current_object(self):
+        return _vars[self.__attrname__].get()
+
     def __getattr__(self, name):
-        child = getattr(_local, self.__attrname__)
-        return getattr(child, name)
+        return getattr(self._get_current_object(), name)
 
     def __setattr__(self, name, value):
         if name in ("__attrname__", ):
             object.__setattr__(self, name, value)
         else:
-            child = getattr(_local, self.__attrname__)
-            setattr(child, name, value)
+            setattr(self._get_current_object(), name, value)
 
     def __delattr__(self, name):
-        child = getattr(_local, self.__attrname__)
-        delattr(child, name)
+        delattr(self._get_current_object(), name)
 
     def _get_dict(self):
-        child = getattr(_local, self.__attrname__)
+        child = self._get_current_object()
         d = child.__class__.__dict__.copy()
-        d.update(child.__dict__)
+        # a slotted object (such as the response) has no instance dict
+        d.update(getattr(child, '__dict__', ()))
         return d
     __dict__ = property(_get_dict)
 
     def __getitem__(self, key):
-        child = getattr(_local, self.__attrname__)
-        return child[key]
+        return self._get_current_object()[key]
 
     def __setitem__(self, key, value):
-        child = getattr(_local, self.__attrname__)
-        child[key] = value
+        self._get_current_object()[key] = value
 
     def __delitem__(self, key):
-        child = getattr(_local, self.__attrname__)
-        del child[key]
+        del self._get_current_object()[key]
 
     def __contains__(self, key):
-        child = getattr(_local, self.__attrname__)
-        return key in child
+        return key in self._get_current_object()
 
     def __len__(self):
-        child = getattr(_local, self.__attrname__)
-        return len(child)
+        return len(self._get_current_object())
 
     def __nonzero__(self):
-        child = getattr(_local, self.__attrname__)
-        return bool(child)
+        return bool(self._get_current_object())
 
     __bool__ = __nonzero__
 
 
-request = _ThreadLocalProxy('request')
-response = _ThreadLocalProxy('response')
+request = _ContextLocalProxy('request')
+response = _ContextLocalProxy('response')
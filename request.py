@@ -1,19 +1,95 @@
 # coding=utf-8
 
-from urllib.parse import parse_qs, quote as url_quote, unquote as url_unquote
-from http.cookies import SimpleCookie
+from urllib.parse import parse_qsl, quote as url_quote, unquote as url_unquote, \
+    unquote_to_bytes
+import re
+import sys
 import time
 from datetime import timedelta, date, datetime
 from json import dumps as json_dumps
 from json import loads as json_loads
 
 from io import BytesIO
+from functools import lru_cache
 
-from structures import MultiDict, ConfigDict, FormsDict, HeadersDict, environ_property,\
-    iter_multi_items, cached_property
+from structures import MultiDict, ConfigDict, FormsDict, HeadersDict, WSGIHeaderDict,\
+    environ_property, iter_multi_items, cached_property
 from formpaser import LimitedStream, FormDataParser, parse_options_header
 
 
+#: The request methods in their canonical form, so that the common ones are
+#: looked up instead of being upper-cased for every request. Unknown methods
+#: are not interned, since they come straight from the client.
+_METHODS = dict((m, sys.intern(m)) for m in
+                ('GET', 'POST', 'PUT', 'DELETE', 'HEAD', 'OPTIONS', 'PATCH'))
+
+
+#: An escape in a cookie value quoted by SimpleCookie: an octal one (\054 for
+#: ',', \073 for ';') or a backslash before a '"' or another backslash.
+_COOKIE_ESCAPE = re.compile(r'\\(?:([0-3][0-7][0-7])|(.))')
+
+
+def _unquote_cookie(value):
+    """
+    Undo the quoting of a cookie value by SimpleCookie (see Response.set_cookie),
+    the value being enclosed in double quotes.
+    """
+    value = value[1:-1]
+    if '\\' not in value:
+        return value
+    return _COOKIE_ESCAPE.sub(
+        lambda m: chr(int(m.group(1), 8)) if m.group(1) else m.group(2), value)
+
+
+@lru_cache(maxsize=256)
+def _header_name(key):
+    """
+    Convert a WSGI environ key into a header name, e.g. 'HTTP_USER_AGENT' into
+    'User-Agent'. The environ keys seen by a server are a small set, so they
+    are cached instead of being converted again for every request.
+    """
+    if key.startswith('HTTP_'):
+        key = key[5:]
+    return key.replace('_', '-').title()
+
+
+@lru_cache(maxsize=1024)
+def _parse_query(query_string):
+    """
+    Parse a query string into a tuple of '(key, value)' pairs. Hot urls are
+    requested again and again with the same query ('?page=2', '?v=1.3'), so
+    the parsed pairs are cached; a tuple, as the result is shared.
+    """
+    return tuple(parse_qsl(query_string, keep_blank_values=True))
+
+
+def _decode_path(path):
+    """
+    Unquote and decode a PATH_INFO. WSGI servers hand it over as a latin-1
+    str holding the raw bytes of the url, so those bytes are unquoted and then
+    decoded as utf-8 in a single pass. A path which is not latin-1 has been
+    decoded by the server already, and is only unquoted.
+    """
+    try:
+        raw = path.encode('latin-1')
+    except UnicodeEncodeError:
+        return url_unquote(path)
+    return unquote_to_bytes(raw).decode('utf-8', 'replace')
+
+
+#: The header names of the environ keys nearly every request has, so these are
+#: a plain dict hit. Other keys go through the bounded cache of :func:'_header_name',
+#: as they come from the client and must not grow a table without limit.
+_HEADER_NAMES = dict((key, _header_name(key)) for key in (
+    'CONTENT_TYPE', 'CONTENT_LENGTH', 'HTTP_HOST', 'HTTP_CONNECTION', 'HTTP_USER_AGENT',
+    'HTTP_ACCEPT', 'HTTP_ACCEPT_ENCODING', 'HTTP_ACCEPT_LANGUAGE', 'HTTP_COOKIE',
+    'HTTP_REFERER', 'HTTP_CACHE_CONTROL', 'HTTP_PRAGMA', 'HTTP_ORIGIN',
+    'HTTP_UPGRADE_INSECURE_REQUESTS', 'HTTP_IF_NONE_MATCH', 'HTTP_IF_MODIFIED_SINCE',
+    'HTTP_X_REQUESTED_WITH', 'HTTP_X_FORWARDED_FOR', 'HTTP_X_FORWARDED_HOST',
+    'HTTP_X_FORWARDED_PROTO', 'HTTP_X_REAL_IP', 'HTTP_DNT', 'HTTP_TE',
+))
+
+
 class Request:
     """
     The request object contains the information transmitted by the client (web browser).
@@ -36,22 +112,45 @@ class Request:
     charset = 'utf-8'
 
     def __init__(self, environ=None):
-        self.environ = {} if environ is None else environ
-
-    def bind_env(self, environ):
-        self.environ = environ
-
-    @property
-    def method(self):
-        return self.environ.get('REQUEST_METHOD', 'GET').upper()
+        self.bind({} if environ is None else environ)
 
-    @property
-    def query_string(self):
-        return self.environ.get('QUERY_STRING', '')
+    def bind(self, environ):
+        """
+        Bind a WSGI environ to this request object and drop everything cached
+        for the previous one. The fields read on every request (method, path,
+        query string, content type and length) are unpacked here once, so
+        later reads are plain attribute lookups instead of environ queries.
 
-    @property
-    def content_type(self):
-        return self.environ.get('CONTENT_TYPE', '')
+        :param environ: the WSGI environ.
+        """
+        d = self.__dict__
+        d.clear()
+        d['environ'] = environ
+        method = environ.get('REQUEST_METHOD', 'GET')
+        d['method'] = _METHODS.get(method) or method.upper()
+        #: Requested path. This works a bit like the regular path info in
+        #: the WSGI environment, but always include a leading slash, even if
+        #: the URL root is accessed.
+        path = environ.get('PATH_INFO') or '/'
+        if path[0] != '/':
+            path = '/' + path
+        # most paths have nothing to unquote, skip the decoder for those
+        if '%' in path or not path.isascii():
+            path = _decode_path(path)
+        d['path'] = path
+        d['query_string'] = environ.get('QUERY_STRING', '')
+        d['content_type'] = environ.get('CONTENT_TYPE', '')
+        #: The request body length as an integer. The client is responsible to
+        #: set this header. Otherwise, the real length of the body is unknown
+        #: and -1 is returned. In this case, :attr:'body' will be empty.
+        #: A malformed header is treated as a missing one, binding must not fail.
+        try:
+            d['content_length'] = int(environ.get('CONTENT_LENGTH') or -1)
+        except ValueError:
+            d['content_length'] = -1
+
+    # An alias for :meth:'bind'
+    bind_env = bind
 
     @property
     def is_chunked(self):
@@ -64,17 +163,6 @@ class Request:
         """
         return 'chunked' in self.environ.get('HTTP_TRANSFER_ENCODING', '').lower()
 
-    @property
-    def content_length(self):
-        """
-        The request body length as an integer. The client is responsible to
-        set this header. Otherwise, the real length of the body is unknown
-        and -1 is returned. In this case, :attr:'body' will be empty.
-
-        :return:
-        """
-        return int(self.environ.get('CONTENT_LENGTH') or -1)
-
     def _load_form_data(self):
         """
         Method used internally to retrieve submitted data. After calling this sets
@@ -92,7 +180,8 @@ class Request:
             content_length = self.content_length
             mimetype, options = parse_options_header(content_type)
             parser = FormDataParser(max_form_memory_size=self.MAX_FORM_MEMORY_SIZE,
-                                    max_content_length=self.MAX_CONTENT_LENGTH)
+                                    max_content_length=self.MAX_CONTENT_LENGTH,
+                                    stream_handlers=self.__dict__.get('_stream_handlers'))
             data = parser.parse(self._get_stream_for_parsing(),
                                 mimetype, content_length, options)
         else:
@@ -149,6 +238,15 @@ class Request:
         if content_length == -1:
             return safe_fallback and BytesIO() or stream
 
+        # an in-memory body (from a test client for instance) of exactly the
+        # content length can be read directly, it ends by itself. A shorter one
+        # is still wrapped, so that the truncation is detected.
+        if type(stream) is BytesIO:
+            with stream.getbuffer() as view:
+                size = view.nbytes
+            if size - stream.tell() == content_length:
+                return stream
+
         return LimitedStream(stream, content_length)
 
     def get_data(self, cache=True, to_unicode=False, parse_form_data=False):
@@ -205,6 +303,19 @@ class Request:
     def __exit__(self, exc_type, exc_val, exc_tb):
         self.close()
 
+    def stream_file(self, name, callback):
+        """
+        Stream the uploaded file of the field 'name' to 'callback' while the form
+        data is parsed, instead of spooling it into :attr:'files'. This keeps the
+        memory (and disk) use of a large upload bounded. It is called as
+        "callback(name, filename, headers, body)", 'body' being an iterator over
+        the chunks of the file, and must be set up before :attr:'form' or
+        :attr:'files' is accessed.
+        """
+        if 'form' in self.__dict__:
+            raise RuntimeError('The form data of this request is parsed already.')
+        self.__dict__.setdefault('_stream_handlers', {})[name] = callback
+
     @cached_property
     def form(self):
         """
@@ -228,6 +339,16 @@ class Request:
         self._load_form_data()
         return self.files
 
+    @cached_property
+    def headers(self):
+        """
+        The headers sent by the client as a case-insensitive :class:'WSGIHeaderDict'.
+        """
+        names = _HEADER_NAMES
+        return WSGIHeaderDict(
+            (names.get(key) or _header_name(key), value) for key, value in self.environ.items()
+            if key.startswith('HTTP_') or key in ('CONTENT_TYPE', 'CONTENT_LENGTH'))
+
     @cached_property
     def values(self):
         """
@@ -243,17 +364,24 @@ class Request:
 
         :return:
         """
-        get = FormsDict()
-        pairs = parse_qs(self.query_string, keep_blank_values=True)
-        for key, value in pairs.items():
-            get.setlist(key, value)
-        return get
+        query_string = self.query_string
+        if not query_string:
+            return FormsDict()
+        return FormsDict(_parse_query(query_string))
 
     args = query = GET
 
     @cached_property
     def POST(self):
-        pass
+        """
+        The values of :attr:'form' and :attr:'files' combined into a :class:'FormsDict'.
+        """
+        post = FormsDict()
+        for key, value in iter_multi_items(self.form):
+            post.add(key, value)
+        for key, value in iter_multi_items(self.files):
+            post.add(key, value)
+        return post
 
     @property
     def is_json(self):
@@ -308,9 +436,22 @@ class Request:
 
         :return:
         """
-        cookies = SimpleCookie(self.environ.get('HTTP_COOKIE', '')).values()
-
-        return FormsDict((c.key, c.value) for c in cookies)
+        cookies = FormsDict()
+        header = self.environ.get('HTTP_COOKIE')
+        if not header:
+            return cookies
+        for part in header.split(';'):
+            key, _, value = part.partition('=')
+            key = key.strip()
+            if not key:
+                continue
+            value = value.strip()
+            if len(value) > 1 and value[0] == value[-1] == '"':
+                value = _unquote_cookie(value)
+            elif '%' in value:
+                value = url_unquote(value)
+            cookies.add(key, value)
+        return cookies
 
     def get_cookie(self, key, default=None):
         """
@@ -326,7 +467,7 @@ class Request:
         """"""
         return self.environ.get('HTTP_REFERER', '0.0.0.0')
 
-    @property
+    @cached_property
     def host(self):
         """
         Returns the real host. First checks the 'X-Forwarded-Host' header, then the normal
@@ -344,7 +485,7 @@ class Request:
                 rv += ':' + self.environ['SERVER_PORT']
         return rv
 
-    @property
+    @cached_property
     def client_addr(self):
         """
         Returns the effective client IP as a string.
@@ -363,7 +504,7 @@ class Request:
             addr = env.get('REMOTE_ADDR', '0.0.0.0')
         return addr
 
-    @property
+    @cached_property
     def host_port(self):
         """
         The effective server port number as a string. if the "HTTP_HOST" header exists in
@@ -388,16 +529,6 @@ class Request:
             port = env['SERVER_PORT']
         return port
 
-    @property
-    def path(self):
-        """
-        Requested path. This works a bit like the regular path info in
-        the WSGI environment, but always include a leading slash, even if
-        the URL root is accessed.
-        :return:
-        """
-        return url_unquote(self.environ.get('PATH_INFO', ''))
-
     @environ_property('environ', 'minim.request.full_path')
     def full_path(self):
         """
@@ -517,4 +648,7 @@ class Request:
         return len(self.environ)
 
     def __repr__(self):
+        if 'wsgi.url_scheme' not in self.__dict__.get('environ', ()):
+            # not bound to a request, e.g. the default of the context variable
+            return '<%s: unbound>' % self.__class__.__name__
         return '<%s: %s %s>' % (self.__class__.__name__, self.method, self.url)
\ No newline at end of file
@@ -0,0 +1,34 @@
+# coding=utf-8
+import unittest
+from http.cookies import SimpleCookie
+
+from request import Request
+
+
+def _request(cookie):
+    return Request({'REQUEST_METHOD': 'GET', 'PATH_INFO': '/', 'HTTP_COOKIE': cookie})
+
+
+class CookiesTest(unittest.TestCase):
+
+    def test_plain_and_percent_escaped(self):
+        cookies = _request('a=1; b=x%20y').cookies
+        self.assertEqual(cookies['a'], '1')
+        self.assertEqual(cookies['b'], 'x y')
+
+    def test_quoted_with_escapes(self):
+        value = 'a,b;c "q" \\'
+        jar = SimpleCookie()
+        jar['x'] = value
+        header = jar['x'].OutputString()
+        self.assertEqual(header, r'x="a\054b\073c \"q\" \\"')
+        cookies = _request(header + '; y=2').cookies
+        self.assertEqual(cookies['x'], value)
+        self.assertEqual(cookies['y'], '2')
+
+    def test_quoted_without_escapes(self):
+        self.assertEqual(_request('x="a b"').cookies['x'], 'a b')
+
+
+if __name__ == '__main__':
+    unittest.main()
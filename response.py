@@ -4,15 +4,18 @@ from http.cookies import SimpleCookie
 import time
 from datetime import timedelta, date, datetime
 from structures import HeadersDict
-from httputil import RESPONSE_STATUSES
+from httputil import STATUS_LINES
 
 
 class Response:
     default_status_code = 200
     default_content_type = 'text/html; charset=utf-8'
 
+    __slots__ = ('_headers', '_status', '_status_code', '_cookies')
+
     def __init__(self, headers=None, status_code=None, content_type=None):
         super().__init__()
+        self._cookies = None
         if isinstance(headers, HeadersDict):
             self._headers = headers
         elif not headers:
@@ -32,6 +35,16 @@ class Response:
         else:
             self._headers['Content-Type'] = content_type
 
+    def reset(self):
+        """
+        Drop the headers and the status of the last response, so that this object
+        can be reused for the next one.
+        """
+        self._headers.clear()
+        self._headers['Content-Type'] = self.default_content_type
+        self.status_code = self.default_status_code
+        self._cookies = None
+
     def copy(self, cls=None):
         pass
 
@@ -45,11 +58,13 @@ class Response:
         return self._status_code
 
     def _set_status_code(self, code):
-        self._status_code = code
         try:
-            self._status = '%d %s' % (code, RESPONSE_STATUSES[code].upper())
+            self._status = STATUS_LINES[code]
         except KeyError:
+            if not 100 <= code <= 999:
+                raise ValueError('Invalid status code: %r' % code)
             self._status = '%d UNKNOWN' % code
+        self._status_code = code
 
     status_code = property(_get_status_code, _set_status_code,
                            doc='The HTTP status code as number')
@@ -60,6 +75,9 @@ class Response:
         return self._status
 
     def _set_status(self, value):
+        if isinstance(value, int):
+            self.status_code = value
+            return
         self._status = value
         try:
             self._status_code = int(self._status.split(None, 1)[0])
@@ -67,7 +85,8 @@ class Response:
             self._status_code = 0
             self._status = '0 %s' % self._status
 
-    status = property(_get_status, _set_status, doc='The HTTP status code')
+    status = property(_get_status, _set_status,
+                      doc='The HTTP status line, may be set to a number as well')
 
     del _get_status, _set_status
 
@@ -13,8 +13,10 @@ import collections
 from threading import RLock
 from configparser import ConfigParser
 from copy import deepcopy
+from functools import lru_cache
 from io import BytesIO
 from utils import import_from_string
+from httputil import RESPONSE_HEADER_DICT
 
 
 __all__ = [
@@ -76,6 +78,11 @@ class cached_property:
     you access the value.
     The class has to have a '__dict__' in order for this property to work.
 
+    It is a non-data descriptor: once the value is stored in the instance
+    '__dict__' it shadows the descriptor, so later reads are plain attribute
+    lookups that never get here. Assigning to the attribute simply replaces
+    the cached value.
+
     It has a lock for thread safety.
     """
     def __init__(self, func, name=None, doc=None):
@@ -89,15 +96,12 @@ class cached_property:
         if obj is None:
             return self
         with self.lock:
-            value = obj.__dict__.get(self.__name__, None)
-            if value is None:
-                value = self.func(obj)
-                obj.__dict__[self.__name__] = value
+            d = obj.__dict__
+            if self.__name__ in d:
+                return d[self.__name__]
+            value = d[self.__name__] = self.func(obj)
             return value
 
-    def __set__(self, obj, value):
-        obj.__dict__[self.__name__] = value
-
 
 class lazy_attribute:
     """A property that caches itself to the class object."""
@@ -120,6 +124,9 @@ class MultiDict(dict):
     dict in that it returns only the newest value for any given key. There are
     special methods available to access the full list of value.
     """
+
+    __slots__ = ()
+
     def __init__(self, mapping=None):
         if isinstance(mapping, MultiDict):
             super().__init__((k, l[:])for k, l in mapping.lists())
@@ -150,9 +157,10 @@ class MultiDict(dict):
         Return the first data value for this key;
         raises KeyError if not found.
         """
-        if key in self:
-            return super().__getitem__(key)[0]
-        raise KeyError('key: %s does not exists.' % key)
+        try:
+            return dict.__getitem__(self, key)[0]
+        except KeyError:
+            raise KeyError('key: %s does not exists.' % key) from None
 
     def __setitem__(self, key, value):
         """
@@ -413,9 +421,14 @@ class FormsDict(MultiDict):
     attribute-like access to its values.
     """
 
+    __slots__ = ()
+
     def __getattr__(self, name):
-        value = self.getlist(name)
-        return value if len(value) > 1 else value[0]
+        # one C-level lookup, and no copy of the value list as with 'getlist'
+        value = dict.get(self, name)
+        if value is None:
+            raise AttributeError(name)
+        return value[:] if len(value) > 1 else value[0]
 
 
 class FilesDict(FormsDict):
@@ -423,6 +436,9 @@ class FilesDict(FormsDict):
     A special sub class of :class:'FormsDict' that has convenience methods
     to add files to it. This is generally useful for unittesting.
     """
+
+    __slots__ = ()
+
     def add_file(self, name, file, filename=None, content_type=None):
         """
         Adds a new file to the dict.
@@ -447,6 +463,17 @@ class FilesDict(FormsDict):
         self.add(name, value)
 
 
+@lru_cache(maxsize=256)
+def _canonical_key(key):
+    """
+    Return the canonical spelling of a header name: the one from
+    :data:'RESPONSE_HEADER_DICT' for the known headers ('etag' -> 'ETag'),
+    otherwise the title-cased name. An application sets the same few names
+    over and over, so the result is cached per spelling.
+    """
+    return RESPONSE_HEADER_DICT.get(key.upper()) or key.title()
+
+
 class HeadersDict:
     """
     An object that stores some headers.  It has a dict-like interface
@@ -667,7 +694,7 @@ class HeadersDict:
         if kw:
             _value = self._options_header_vkw(_value, kw)
         self._validate_value(_value)
-        self._list.append((_key.title(), _value))
+        self._list.append((_canonical_key(_key), _value))
 
     @staticmethod
     def _validate_value(value):
@@ -700,17 +727,17 @@ class HeadersDict:
             _value = self._options_header_vkw(_value, kw)
         self._validate_value(_value)
         if not self._list:
-            self._list.append((_key.title(), _value))
+            self._list.append((_canonical_key(_key), _value))
             return
         list_iter = iter(self._list)
         ikey = _key.lower()
         for idx, (old_key, old_value) in enumerate(list_iter):
             if old_key.lower() == ikey:
                 # replace first appearance
-                self._list[idx] = (_key.title(), _value)
+                self._list[idx] = (_canonical_key(_key), _value)
                 break
         else:
-            self._list.append((_key.title(), _value))
+            self._list.append((_canonical_key(_key), _value))
             return
         self._list[idx + 1:] = [t for t in list_iter if t[0].lower() != ikey]
 
@@ -745,9 +772,14 @@ class HeadersDict:
         """Convert the headers into a list suitable for WSGI.
         The values are unicode strings in Python 3 for the WSGI server to encode.
 
+        The headers are already stored as such a list, so this is a plain slice
+        copy. It has to be a copy: servers such as wsgiref keep the list they
+        are given until the response is sent, while the :class:`HeadersDict`
+        of a pooled response is cleared for the next request.
+
         :return: list
         """
-        return list(self)
+        return self._list[:]
 
     def copy(self):
         return self.__class__(self._list)
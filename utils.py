@@ -12,6 +12,7 @@ import tempfile
 import timeit
 import re
 import threading
+from functools import lru_cache
 from unicodedata import normalize
 
 
@@ -32,8 +33,13 @@ __all__ = [
 ]
 
 
+_SEQUENCE_TYPES = (tuple, list, set)
+
+
 def make_list(data):
-    if isinstance(data, (tuple, list, set)):
+    # an exact type check is cheaper than isinstance; subclasses of tuple, list
+    # or set are treated as a single item
+    if type(data) in _SEQUENCE_TYPES:
         return list(data)
     elif data:
         return [data]
@@ -92,6 +98,9 @@ def unquote_header_value(value, is_filename=False):
         # probably some other browsers as well.  IE for example is
         # uploading files with "C:\foo\bar.txt" as filename
         value = value[1:-1]
+        # nothing is escaped in most values
+        if '\\' not in value:
+            return value
 
         # if this is a filename and the starting characters look like
         # a UNC path, then just return the value without quotes.  Using the
@@ -130,6 +139,13 @@ def parse_options_header(value, multiple=False):
     if not value:
         return '', {}
 
+    # the options are cached as tuples, every caller gets its own dicts
+    return tuple(dict(item) if type(item) is tuple else item
+                 for item in _parse_options_header(value, multiple))
+
+
+@lru_cache(maxsize=1024)
+def _parse_options_header(value, multiple):
     result = []
 
     value = "," + value.replace("\n", ",")
@@ -153,7 +169,7 @@ def parse_options_header(value, multiple=False):
                     option == 'filename')
             options[option] = option_value
             rest = rest[optmatch.end():]
-        result.append(options)
+        result.append(tuple(options.items()))
         if multiple is False:
             return tuple(result)
         value = rest